@@ -10,9 +10,12 @@ import sys
 import logging
 import subprocess
 import argparse
+import mmap
+import re
+import shlex
 import shutil
 from pathlib import Path
-from typing import Dict, Optional, Union, NoReturn
+from typing import Dict, List, Optional, Union, NoReturn
 
 logging.basicConfig(
     level=logging.INFO,
@@ -21,23 +24,25 @@ logging.basicConfig(
 )
 
 HERE = Path(__file__).parent
+ENV_LINE_PATTERN = re.compile(rb"^[ \t]*([A-Za-z_]\w*)=(.*?)[ \t\r]*$", re.MULTILINE)
 
 
-def run_command(command: str, check: bool = True) -> Optional[NoReturn]:
+def run_command(command: Union[str, List[str]], check: bool = True) -> Optional[NoReturn]:
     """
-    Execute a shell command and handle potential errors.
+    Execute a command without a shell and handle potential errors.
 
     Args:
-        command: Shell command to execute
+        command: Command line (split with shlex) or argument list to execute
         check: If True, raises CalledProcessError on non-zero exit status
 
     Raises:
         subprocess.CalledProcessError: If the command fails and check is True
         SystemExit: If check is True and command fails
     """
+    args = shlex.split(command) if isinstance(command, str) else [str(arg) for arg in command]
     try:
-        subprocess.run(command, check=check, shell=True)
-    except subprocess.CalledProcessError as e:
+        subprocess.run(args, check=check, shell=False)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
         logging.info(f"Error executing command: {command}")
         logging.info(f"Error: {str(e)}")
         if check:
@@ -82,7 +87,7 @@ def setup_cuda(cuda_version: str) -> None:
     Args:
         cuda_version: Version string of CUDA to configure
     """
-    run_command(f"ldconfig /usr/local/{cuda_version}/compat/")
+    run_command(["ldconfig", f"/usr/local/{cuda_version}/compat/"])
 
 
 def install_python_packages(worker_infinity_requirements: Union[str, Path], additional_requirements: Optional[Union[str, Path]] = None) -> None:
@@ -93,17 +98,26 @@ def install_python_packages(worker_infinity_requirements: Union[str, Path], addi
         worker_infinity_requirements: Path to worker-infinity's requirements.txt
         additional_requirements: Optional path to additional project requirements
     """
-    # First upgrade pip alone
-    run_command("python3 -m pip install --no-cache-dir --upgrade pip")
-
-    # Install worker-infinity requirements
-    run_command(f"python3 -m pip install --no-cache-dir --upgrade -r {worker_infinity_requirements}")
-
-    # Install additional requirements if provided
+    # Upgrade pip and install all requirements in a single resolver run
+    # (--upgrade now also applies to the additional requirements)
+    command = [
+        "python3",
+        "-m",
+        "pip",
+        "install",
+        "--no-cache-dir",
+        "--disable-pip-version-check",
+        "--prefer-binary",
+        "--upgrade",
+        "pip",
+        "-r",
+        worker_infinity_requirements,
+    ]
     if additional_requirements and (_req := HERE / additional_requirements).exists():
-        run_command(f"python3 -m pip install --no-cache-dir -r {_req}")
+        command += ["-r", _req]
     else:
         logging.info("Le fichier des requirements personnalisé n'a pas été trouvé.")
+    run_command(command)
 
 
 def setup_infinity_environment(src_dir: Optional[Union[str, Path]] = None) -> Path:
@@ -127,18 +141,38 @@ def setup_infinity_environment(src_dir: Optional[Union[str, Path]] = None) -> Pa
     # Ensure we use absolute paths
     worker_infinity_path = Path(__file__).parent.parent / "worker-infinity-embedding"
 
-    # Always ensure a fresh clone of worker-infinity in parent directory
-    if worker_infinity_path.exists():
-        shutil.rmtree(worker_infinity_path)
-
-    run_command(f"git clone https://github.com/runpod-workers/worker-infinity-embedding.git {worker_infinity_path}")
+    # Reuse an existing clone by resetting it to the remote HEAD, otherwise make a fresh shallow clone
+    if (worker_infinity_path / ".git").exists():
+        run_command(["git", "-C", worker_infinity_path, "fetch", "--depth", "1", "origin"])
+        run_command(["git", "-C", worker_infinity_path, "reset", "--hard", "FETCH_HEAD"])
+    else:
+        if worker_infinity_path.exists():
+            shutil.rmtree(worker_infinity_path)
+        run_command(
+            [
+                "git",
+                "clone",
+                "--depth",
+                "1",
+                "--filter=blob:none",
+                "--single-branch",
+                "https://github.com/runpod-workers/worker-infinity-embedding.git",
+                worker_infinity_path,
+            ]
+        )
 
     # Override source files if src_dir is provided
     if src_dir and (path_src_dir := (Path(__file__).parent / src_dir)).exists():
         vllm_src_dir = worker_infinity_path / "src"
         vllm_src_dir.mkdir(parents=True, exist_ok=True)
         for py_file in path_src_dir.glob("*.py"):
-            shutil.copy(str(py_file), str(vllm_src_dir))
+            target = vllm_src_dir / py_file.name
+            target.unlink(missing_ok=True)
+            # Hardlink when on the same filesystem, copy otherwise
+            try:
+                os.link(py_file, target)
+            except OSError:
+                shutil.copy2(py_file, target)
 
     return worker_infinity_path
 
@@ -155,14 +189,9 @@ def setup_base_directories() -> str:
     """
     base_path = os.environ.get("BASE_PATH", "/models")
 
-    directories = [
-        base_path,
-        f"{base_path}/huggingface-cache/datasets",
-        f"{base_path}/huggingface-cache/hub",
-    ]
-
-    for directory in directories:
-        Path(directory).mkdir(parents=True, exist_ok=True)
+    # Only the leaf directories are listed: makedirs creates base_path and huggingface-cache on the way
+    for directory in (f"{base_path}/huggingface-cache/datasets", f"{base_path}/huggingface-cache/hub"):
+        os.makedirs(directory, exist_ok=True)
 
 
 def load_env_file(env_path: Union[str, Path]) -> Dict[str, str]:
@@ -186,15 +215,17 @@ def load_env_file(env_path: Union[str, Path]) -> Dict[str, str]:
         return {}
 
     env_vars: Dict[str, str] = {}
-    with open(env_path) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith("#"):
-                key, value = line.split("=", 1)
-                # Handle variable expansion
+    if not os.path.getsize(env_path):
+        return env_vars
+    with open(env_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for match in ENV_LINE_PATTERN.finditer(mm):
+            key, value = match.group(1).decode(), match.group(2).decode()
+            # Handle variable expansion
+            if "$" in value:
                 value = os.path.expandvars(value)
-                os.environ[key] = value
-                env_vars[key] = value
+            # Set immediately so that later lines can expand it
+            os.environ[key] = value
+            env_vars[key] = value
     return env_vars
 
 
@@ -217,7 +248,7 @@ def copy_files(env_file: Union[str, Path], src_dir: Union[str, Path]) -> None:
     # Always ensure environment.env is in /root if provided
     if env_file and Path(env_file).exists():
         print(f"Copying {env_file} to /root/.env")
-        shutil.copy(env_file, "/root/.env")
+        shutil.copy2(env_file, "/root/.env")
 
     # Setup base directories and get BASE_PATH
     setup_base_directories()
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from functools import cached_property
+from dataclasses import dataclass, field
 
 DEFAULT_BATCH_SIZE = 32
 DEFAULT_BACKEND = "torch"
@@ -10,53 +10,48 @@ if not os.environ.get("INFINITY_QUEUE_SIZE"):
     os.environ["INFINITY_QUEUE_SIZE"] = "48000"
 
 
+def _get_model_names() -> tuple[str, ...]:
+    model_names = os.environ.get("MODEL_PATHS") or os.environ.get("MODEL_NAMES")
+    if not model_names:
+        raise ValueError(
+            "Missing required environment variable 'MODEL_NAMES'.\n"
+            "Please provide at least one HuggingFace model ID, or multiple IDs separated by a semicolon.\n"
+            "Examples:\n"
+            "  MODEL_PATHS=BAAI/bge-small-en-v1.5\n"
+            "  MODEL_PATHS=BAAI/bge-small-en-v1.5;intfloat/e5-large-v2\n"
+        )
+    return tuple(model_name for model_name in model_names.split(";") if model_name)
+
+
+def _get_no_required_multi(name, count, default=None) -> list[str]:
+    out = os.getenv(name, f"{default};" * count).split(";")
+    out = [o for o in out if o]
+    if len(out) != count:
+        raise ValueError(f"Env var: {name} must have the same number of elements as MODEL_NAMES")
+    return out
+
+
+@dataclass(frozen=True, slots=True)
 class EmbeddingServiceConfig:
-    def __init__(self):
-        load_dotenv()
+    """Service settings, read from the environment once at construction."""
+
+    backend: str = field(init=False)
+    model_names: tuple[str, ...] = field(init=False)
+    models_display_names: tuple[str, ...] = field(init=False)
+    batch_sizes: tuple[int, ...] = field(init=False)
+    dtypes: tuple[str, ...] = field(init=False)
+    runpod_max_concurrency: int = field(init=False)
 
-    def _get_no_required_multi(self, name, default=None):
-        out = os.getenv(name, f"{default};" * len(self.model_names)).split(";")
-        out = [o for o in out if o]
-        if len(out) != len(self.model_names):
-            raise ValueError(f"Env var: {name} must have the same number of elements as MODEL_NAMES")
-        return out
-
-    @cached_property
-    def backend(self):
-        return os.environ.get("BACKEND", DEFAULT_BACKEND)
-
-    @cached_property
-    def model_names(self) -> list[str]:
-        model_names = os.environ.get("MODEL_PATHS") or os.environ.get("MODEL_NAMES")
-        if not model_names:
-            raise ValueError(
-                "Missing required environment variable 'MODEL_NAMES'.\n"
-                "Please provide at least one HuggingFace model ID, or multiple IDs separated by a semicolon.\n"
-                "Examples:\n"
-                "  MODEL_PATHS=BAAI/bge-small-en-v1.5\n"
-                "  MODEL_PATHS=BAAI/bge-small-en-v1.5;intfloat/e5-large-v2\n"
-            )
-        model_names = model_names.split(";")
-        model_names = [model_name for model_name in model_names if model_name]
-        return model_names
-
-    @cached_property
-    def models_display_names(self) -> list[str]:
-        display_names = self._get_no_required_multi("MODEL_NAMES", self.model_names)
-        display_names = [name.strip() for name in display_names if name.strip()]
-        return display_names
-
-    @cached_property
-    def batch_sizes(self) -> list[int]:
-        batch_sizes = self._get_no_required_multi("BATCH_SIZES", DEFAULT_BATCH_SIZE)
-        batch_sizes = [int(batch_size) for batch_size in batch_sizes]
-        return batch_sizes
-
-    @cached_property
-    def dtypes(self) -> list[str]:
-        dtypes = self._get_no_required_multi("DTYPES", "auto")
-        return dtypes
-
-    @cached_property
-    def runpod_max_concurrency(self) -> int:
-        return int(os.environ.get("RUNPOD_MAX_CONCURRENCY", 300))
+    def __post_init__(self):
+        load_dotenv()
+        model_names = _get_model_names()
+        count = len(model_names)
+        display_names = _get_no_required_multi("MODEL_NAMES", count, list(model_names))
+        batch_sizes = _get_no_required_multi("BATCH_SIZES", count, DEFAULT_BATCH_SIZE)
+        # frozen dataclass: attributes are set once, here
+        object.__setattr__(self, "backend", os.environ.get("BACKEND", DEFAULT_BACKEND))
+        object.__setattr__(self, "model_names", model_names)
+        object.__setattr__(self, "models_display_names", tuple(name.strip() for name in display_names if name.strip()))
+        object.__setattr__(self, "batch_sizes", tuple(int(batch_size) for batch_size in batch_sizes))
+        object.__setattr__(self, "dtypes", tuple(_get_no_required_multi("DTYPES", count, "auto")))
+        object.__setattr__(self, "runpod_max_concurrency", int(os.environ.get("RUNPOD_MAX_CONCURRENCY", 300)))
@@ -1,58 +1,177 @@
 import os
+import asyncio
+import importlib.util
 import logging
-import glob
-from huggingface_hub import snapshot_download
-from utils import timer_decorator
+import fnmatch
+import json
+import re
+import threading
+
+# huggingface_hub lit cette variable à l'import : elle doit être définie avant
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+from huggingface_hub import HfApi, constants, snapshot_download  # noqa: E402
+from huggingface_hub.utils import LocalEntryNotFoundError  # noqa: E402
+from requests.exceptions import RequestException  # noqa: E402
+from utils import timer_decorator  # noqa: E402
 
 logging.basicConfig(level=logging.INFO)
 
 BASE_DIR = "/"
 TOKENIZER_PATTERNS = [["*.json", "tokenizer*"]]
 MODEL_PATTERNS = [["*.safetensors"], ["*.bin"], ["*.pt"]]
-CODE_PATTERNS = [["*.py"]] if os.getenv("TRUST_REMOTE_CODE") and os.getenv("TRUST_REMOTE_CODE").lower() == "true" else None
+_TRUST_REMOTE = os.getenv("TRUST_REMOTE_CODE", "").lower() == "true"
+CODE_PATTERNS = [["*.py"]] if _TRUST_REMOTE else None
+# jeux de patterns figés à l'import, un par format de poids (dans l'ordre de MODEL_PATTERNS)
+MODEL_PATTERN_SETS = tuple(
+    tuple(model_pattern + TOKENIZER_PATTERNS[0] + (CODE_PATTERNS[0] if _TRUST_REMOTE else [])) for model_pattern in MODEL_PATTERNS
+)
+TOKENIZER_PATTERN_SET = tuple(TOKENIZER_PATTERNS[0])
+# le pattern des poids est toujours le premier du jeu : c'est le seul dont la présence est vérifiée
+WEIGHTS_REGEXES = {pattern_set: re.compile(fnmatch.translate(pattern_set[0])) for pattern_set in MODEL_PATTERN_SETS + (TOKENIZER_PATTERN_SET,)}
+MAX_WORKERS = int(os.getenv("HF_HUB_MAX_WORKERS", "16"))
+# les téléchargements tournent en parallèle : un seul thread désactive hf_transfer
+_HF_TRANSFER_LOCK = threading.Lock()
+
+
+def select_model_pattern_sets(name, revision):
+    try:
+        files = HfApi().list_repo_files(name, revision=revision)
+    except RequestException as e:
+        # Hub injoignable : on essaie chaque format comme avant, snapshot_download retombera sur le cache
+        logging.warning("Impossible de lister les fichiers de %s (%s), essai de tous les formats.", name, e)
+        return MODEL_PATTERN_SETS
+    # seuls les fichiers à la racine du snapshot comptent, comme pour la vérification après téléchargement
+    files = [f for f in files if "/" not in f]
+    for model_pattern, pattern_set in zip(MODEL_PATTERNS, MODEL_PATTERN_SETS):
+        if any(f.endswith(model_pattern[0][1:]) for f in files):
+            return (pattern_set,)
+    raise ValueError(f"No model weights matching {MODEL_PATTERNS} found in {name}.")
+
+
+def has_match(path, regex):
+    with os.scandir(path) as entries:
+        return any(regex.match(entry.name) for entry in entries)
+
+
+def snapshot_is_complete(path, pattern_set):
+    # un téléchargement interrompu peut laisser un snapshot partiel : tous les patterns doivent être présents
+    names = os.listdir(path)
+    if not all(fnmatch.filter(names, pattern) for pattern in pattern_set):
+        return False
+    # modèles shardés : chaque fichier référencé par un *.index.json doit exister
+    for index_name in fnmatch.filter(names, "*.index.json"):
+        try:
+            with open(os.path.join(path, index_name)) as f:
+                shards = set(json.load(f).get("weight_map", {}).values())
+        except (OSError, ValueError):
+            return False
+        if not all(os.path.exists(os.path.join(path, shard)) for shard in shards):
+            return False
+    return True
+
+
+def find_cached_snapshot(name, revision, cache_dir, pattern_sets):
+    # démarrage à chaud : aucune requête réseau si le snapshot complet est déjà en cache
+    try:
+        path = snapshot_download(name, revision=revision, cache_dir=cache_dir, local_files_only=True)
+    except LocalEntryNotFoundError:
+        return None
+    for pattern_set in pattern_sets:
+        if snapshot_is_complete(path, pattern_set):
+            return path
+    return None
 
 
 @timer_decorator
 def download(name, revision, type, cache_dir):
     if type == "model":
-        pattern_sets = [model_pattern + TOKENIZER_PATTERNS[0] for model_pattern in MODEL_PATTERNS]
-        if CODE_PATTERNS:
-            pattern_sets = [model_pattern + TOKENIZER_PATTERNS[0] + CODE_PATTERNS[0] for model_pattern in MODEL_PATTERNS]
-        else:
-            pattern_sets = [model_pattern + TOKENIZER_PATTERNS[0] for model_pattern in MODEL_PATTERNS]
+        pattern_sets = MODEL_PATTERN_SETS
     elif type == "tokenizer":
-        pattern_sets = TOKENIZER_PATTERNS
+        pattern_sets = (TOKENIZER_PATTERN_SET,)
     else:
         raise ValueError(f"Invalid type: {type}")
 
+    cached_path = find_cached_snapshot(name, revision, cache_dir, pattern_sets)
+    if cached_path:
+        logging.info("Model %s already in cache: %s", name, cached_path)
+        return cached_path
+    if type == "model":
+        pattern_sets = select_model_pattern_sets(name, revision)
+
     try:
         for pattern_set in pattern_sets:
             try:
-                logging.info(f"starting download of mode {name} with pattern {pattern_set}")
-                path = snapshot_download(name, revision=revision, cache_dir=cache_dir, allow_patterns=pattern_set)
-                success = True
-                for pattern in pattern_set:
-                    if glob.glob(os.path.join(path, pattern)):
-                        logging.info(f"Successfully downloaded {pattern} model files.")
-                    else:
-                        success = False
-                        logging.info(f"Pattern {pattern} not found in {path}.")
-                if success:
+                logging.info("starting download of mode %s with pattern %s", name, pattern_set)
+                path = snapshot_download(
+                    name,
+                    revision=revision,
+                    cache_dir=cache_dir,
+                    allow_patterns=pattern_set,
+                    max_workers=MAX_WORKERS,
+                )
+                if has_match(path, WEIGHTS_REGEXES[pattern_set]):
+                    logging.info("Successfully downloaded %s model files.", pattern_set[0])
                     return path
-            except RuntimeError as e:
+                logging.info("Pattern %s not found in %s.", pattern_set[0], path)
+            except (RuntimeError, ValueError) as e:
+                # ValueError : HF_HUB_ENABLE_HF_TRANSFER=1 alors que le paquet hf_transfer est absent
                 logging.info("Une erreur de runtime est survenue.")
-                if "HF_HUB_ENABLE_HF_TRANSFER" in str(e) and os.getenv("HF_HUB_ENABLE_HF_TRANSFER"):
-                    logging.warning("Échec avec hf_transfer, désactivation pour les prochains téléchargements")
-                    os.environ.pop("HF_HUB_ENABLE_HF_TRANSFER", None)
+                # on se fie au message seul : un autre thread a pu retirer la variable entre-temps
+                if "HF_HUB_ENABLE_HF_TRANSFER" in str(e):
+                    with _HF_TRANSFER_LOCK:
+                        if constants.HF_HUB_ENABLE_HF_TRANSFER:
+                            logging.warning("Échec avec hf_transfer, désactivation pour les prochains téléchargements")
+                            os.environ.pop("HF_HUB_ENABLE_HF_TRANSFER", None)
+                            constants.HF_HUB_ENABLE_HF_TRANSFER = False
                     # Réessayer immédiatement avec hf_transfer désactivé
-                    path = snapshot_download(name, revision=revision, cache_dir=cache_dir, allow_patterns=pattern_set)
+                    path = snapshot_download(
+                        name,
+                        revision=revision,
+                        cache_dir=cache_dir,
+                        allow_patterns=pattern_set,
+                        max_workers=MAX_WORKERS,
+                    )
                     return path
                 else:
                     raise
+        raise ValueError(f"No model weights found for {name}.")
     except ValueError:
         raise ValueError(f"No patterns matching {pattern_sets} found for download.")
     except Exception as e:
-        logging.error(f"Erreur FATALE : {e}")
+        logging.error("Erreur FATALE : %s", e)
+
+
+def write_env_file(path, environment_variables):
+    # une ligne multiligne ou une clé contenant "=" corromprait le fichier
+    payload = "".join(
+        f"{k}={v}\n" for k, v in environment_variables.items() if "=" not in k and "\n" not in k and "\n" not in str(v)
+    ).encode()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+
+
+async def download_all(models, cache_dir):
+    # gather renvoie les chemins dans l'ordre de models, quel que soit l'ordre de fin
+    workers = int(os.getenv("HF_DOWNLOAD_WORKERS", "4"))
+    if workers < 1:
+        raise ValueError(f"HF_DOWNLOAD_WORKERS must be at least 1, got {workers}")
+    semaphore = asyncio.Semaphore(workers)
+
+    async def _download(model_name, model_revision):
+        async with semaphore:
+            logging.info("démarrage du téléchargement du modèle: %s", model_name)
+            model_path = await asyncio.to_thread(download, model_name, model_revision, "model", cache_dir)
+            logging.info("téléchargement terminé pour le modèle: %s", model_name)
+            return model_path
+
+    return await asyncio.gather(*[_download(model_name, model_revision) for model_name, model_revision in models])
 
 
 def __call__():
@@ -60,10 +179,12 @@ def __call__():
     environment_variables.update(os.environ)
     cache_dir = environment_variables.get("HF_HOME")
     model_names, model_revisions = environment_variables.get("MODEL_NAMES"), environment_variables.get("MODEL_REVISION") or None
+    model_names = [model_name for model_name in model_names.split(";") if model_name]
+    model_revisions = model_revisions.split(";") if model_revisions else [None] * len(model_names)
+    models = list(zip(model_names, model_revisions))
     model_files = {}
-    for model_name, model_revision in zip(model_names.split(";"), model_revisions.split(";")):
-        logging.info(f"démarrage du téléchargement du modèle: {model_name}")
-        model_path = download(model_name, model_revision, "model", cache_dir)
+    model_paths = asyncio.run(download_all(models, cache_dir))
+    for model_path in model_paths:
         if "MODEL_PATHS" not in model_files:
             model_files["MODEL_PATHS"] = f"{model_path};"
         else:
@@ -71,9 +192,7 @@ def __call__():
     for k, v in model_files.items():
         if v not in (None, ""):
             environment_variables[k] = v
-    with open("/root/.env", "w") as f:
-        for k, v in environment_variables.items():
-            f.write(f"{k}={v}\n")
+    write_env_file("/root/.env", environment_variables)
 
 
 if __name__ == "__main__":